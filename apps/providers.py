@@ -1,4 +1,5 @@
 import os, requests
+from contextlib import contextmanager
 from typing import Optional
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from openai import OpenAI
@@ -8,6 +9,98 @@ def _openai_client(base_url: Optional[str] = None):
         return OpenAI(base_url=base_url, api_key=os.getenv("OPENAI_API_KEY","EMPTY"))
     return OpenAI()
 
+# Prompt-cache accounting for the current run, from OpenAI-style usage
+# (prompt_tokens_details.cached_tokens). Only calls whose response reports
+# cached_tokens are counted, so the ratio isn't diluted by calls that don't.
+# Ollama exposes no cache-hit figure and is not counted.
+CACHE_STATS = {"reported": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+def reset_cache_stats():
+    for k in CACHE_STATS: CACHE_STATS[k] = 0
+
+def _record_openai(r):
+    usage = getattr(r, "usage", None)
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    if cached is None: return
+    CACHE_STATS["reported"] += 1
+    CACHE_STATS["prompt_tokens"] += usage.prompt_tokens or 0
+    CACHE_STATS["cached_tokens"] += cached
+
+def _ollama_base(block):
+    return block.get("base_url","http://localhost:11434").rstrip("/")
+
+def _ollama_options(block):
+    opts = {"temperature": block.get("temperature",0.6),
+            "num_predict": block.get("max_tokens",512)}
+    # num_ctx must stay identical across calls: a different value reloads the model
+    if block.get("num_ctx"): opts["num_ctx"] = block["num_ctx"]
+    return opts
+
+@contextmanager
+def resident(block: dict):
+    """Keep the model loaded until the block exits and yield the block to call it with.
+
+    For Ollama the yielded copy carries keep_alive=-1, so every request made
+    with it (in this process or shipped to Ray actors) keeps the pin instead of
+    resetting it. Other providers stay resident and get `block` back unchanged.
+    """
+    if block["provider"].lower() != "ollama":
+        yield block
+        return
+    url = f"{_ollama_base(block)}/api/generate"
+    # load and release carry the same runner options, or Ollama reloads the model
+    load = {"model": block["model"]}
+    if block.get("num_ctx"): load["options"] = {"num_ctx": block["num_ctx"]}
+    @retry(stop=stop_after_attempt(4),
+           wait=wait_exponential(min=1, max=20),
+           retry=retry_if_exception_type((requests.ConnectionError, requests.Timeout)))
+    def _pin():
+        requests.post(url, json={**load, "keep_alive": -1}, timeout=180).raise_for_status()
+    _pin()
+    try:
+        yield {**block, "keep_alive": -1}
+    finally:
+        # hand residency back to the configured idle timeout, or the server's
+        # OLLAMA_KEEP_ALIVE when none is configured
+        if block.get("keep_alive") is not None: load["keep_alive"] = block["keep_alive"]
+        try:
+            requests.post(url, json=load, timeout=30)
+        except requests.RequestException:
+            pass
+
+def server_prefix_stats(block: dict) -> Optional[dict]:
+    """Prefix-cache metrics scraped from a vLLM server's /metrics, or None if not exposed.
+
+    Newer vLLM exports cumulative counters ({"hits", "queries"}, summed over label
+    sets) so callers can diff two snapshots; 0.5.x/0.6.x only a since-start
+    {"gauge"}, taken from the first series.
+    """
+    if block["provider"].lower() != "vllm" or not block.get("base_url"):
+        return None
+    base = block["base_url"].rstrip("/")
+    if base.endswith("/v1"): base = base[:-3]
+    try:
+        text = requests.get(f"{base}/metrics", timeout=5).text
+    except requests.RequestException:
+        return None
+    counters, gauge = {}, None
+    for line in text.splitlines():
+        if not line.startswith("vllm:"): continue
+        name, _, val = line.rpartition(" ")
+        key = name.split("{", 1)[0]
+        try:
+            val = float(val)
+        except ValueError:
+            continue
+        if key in ("vllm:prefix_cache_hits_total", "vllm:prefix_cache_queries_total"):
+            counters[key] = counters.get(key, 0.0) + val
+        elif key == "vllm:gpu_prefix_cache_hit_rate" and gauge is None:
+            gauge = val
+    if "vllm:prefix_cache_queries_total" in counters:
+        return {"hits": counters.get("vllm:prefix_cache_hits_total", 0.0),
+                "queries": counters["vllm:prefix_cache_queries_total"]}
+    return {"gauge": gauge} if gauge is not None else None
+
 def call_chat(block: dict, system: str, user: str) -> str:
     prov = block["provider"].lower()
     if prov == "openai":
@@ -18,6 +111,7 @@ def call_chat(block: dict, system: str, user: str) -> str:
             messages=[{"role":"system","content":system},{"role":"user","content":user}],
             max_tokens=block.get("max_tokens",512)
         )
+        _record_openai(r)
         return r.choices[0].message.content
 
     if prov == "vllm":
@@ -28,18 +122,18 @@ def call_chat(block: dict, system: str, user: str) -> str:
             messages=[{"role":"system","content":system},{"role":"user","content":user}],
             max_tokens=block.get("max_tokens",512)
         )
+        _record_openai(r)
         return r.choices[0].message.content
 
     if prov == "ollama":
-        base = block.get("base_url","http://localhost:11434")
-        url  = f"{base.rstrip('/')}/api/chat"
+        url  = f"{_ollama_base(block)}/api/chat"
         payload = {
             "model": block["model"],
             "messages": [{"role":"system","content":system},{"role":"user","content":user}],
             "stream": False,
-            "options": {"temperature": block.get("temperature",0.6),
-                        "num_predict": block.get("max_tokens",512)}
+            "options": _ollama_options(block)
         }
+        if block.get("keep_alive") is not None: payload["keep_alive"] = block["keep_alive"]
         @retry(stop=stop_after_attempt(4),
                wait=wait_exponential(min=1, max=20),
                retry=retry_if_exception_type((requests.ConnectionError, requests.Timeout)))
@@ -0,0 +1,49 @@
+import os
+from apps.providers import call_chat, resident, reset_cache_stats, server_prefix_stats, CACHE_STATS
+
+def prefix_order(prompts):
+    """Indices of `prompts` in lexicographic order, so requests sharing a rendered prefix run back to back."""
+    return sorted(range(len(prompts)), key=prompts.__getitem__)
+
+def shared_prefix_ratio(prompts):
+    """Fraction of prompt chars shared with the previous request (upper bound on KV reuse for this order)."""
+    total = shared = 0
+    prev = ""
+    for p in prompts:
+        shared += len(os.path.commonprefix([prev, p]))
+        total += len(p)
+        prev = p
+    return shared / total if total else 0.0
+
+def call_many(block: dict, system: str, prompts: list, schedule: str = "file") -> list:
+    """Send every prompt to `block` and return replies in input order.
+
+    schedule="prefix" sends them sorted by rendered prompt so vLLM prefix caching
+    and Ollama's KV reuse see long shared prefixes; the model is kept resident
+    for the whole batch either way.
+    """
+    if schedule not in ("file", "prefix"):
+        raise ValueError(f"Unknown schedule: {schedule}")
+    order = prefix_order(prompts) if schedule == "prefix" else list(range(len(prompts)))
+    outs = [None] * len(prompts)
+    reset_cache_stats()
+    before = server_prefix_stats(block)
+    with resident(block) as pinned:
+        for i in order:
+            outs[i] = call_chat(pinned, system, prompts[i])
+    report(block, [prompts[i] for i in order], schedule, before, server_prefix_stats(block))
+    return outs
+
+def report(block, ordered_prompts, schedule, before=None, after=None):
+    line = f"[{block['model']}] schedule={schedule} shared_prefix={shared_prefix_ratio(ordered_prompts):.1%}"
+    if CACHE_STATS["prompt_tokens"]:
+        line += f" cached_tokens={CACHE_STATS['cached_tokens']}/{CACHE_STATS['prompt_tokens']}" \
+                f" ({CACHE_STATS['cached_tokens'] / CACHE_STATS['prompt_tokens']:.1%})"
+    if after and "queries" in after:
+        # counters are cumulative since server start: diff to get this batch only
+        if before and "queries" in before and after["queries"] > before["queries"]:
+            rate = (after["hits"] - before["hits"]) / (after["queries"] - before["queries"])
+            line += f" server_prefix_hit_rate={rate:.1%}"
+    elif after and "gauge" in after:
+        line += f" server_prefix_hit_rate(cumulative)={after['gauge']:.1%}"
+    print(line)
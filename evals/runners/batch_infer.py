@@ -8,7 +8,7 @@ from pathlib import Path
 from dotenv import load_dotenv, find_dotenv
 from guardrails import Guard
 from apps.wellness_coach.schemas import WellnessOutput
-from apps.providers import call_chat
+from apps.scheduling import call_many
 
 load_dotenv(find_dotenv(usecwd=True))
 CFG = yaml.safe_load(open("configs/model.yaml"))
@@ -23,12 +23,15 @@ def guard_and_parse(raw_text: str):
 
 def run(split_path, model_block, prompt_name, tag, out_path, limit=None):
     T = ENV.get_template(prompt_name)
-    outs = []
+    rows = []
     for i, line in enumerate(open(split_path)):
         if limit and i >= limit: break
-        ex = json.loads(line)
-        prompt = T.render(**ex)
-        raw = call_chat(model_block, "You are a careful wellness coach.", prompt)
+        rows.append(json.loads(line))
+    # render everything up front so the scheduler can group shared prefixes
+    raws = call_many(model_block, "You are a careful wellness coach.",
+                     [T.render(**ex) for ex in rows], model_block.get("schedule", "file"))
+    outs = []
+    for ex, raw in zip(rows, raws):
         try:
             parsed = guard_and_parse(raw); blocked = False
         except Exception:
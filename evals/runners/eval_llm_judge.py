@@ -6,7 +6,7 @@ if ROOT not in sys.path: sys.path.insert(0, ROOT)
 import json, yaml
 from statistics import mean
 from dotenv import load_dotenv, find_dotenv
-from apps.providers import call_chat
+from apps.scheduling import call_many
 
 load_dotenv(find_dotenv(usecwd=True))
 CFG = yaml.safe_load(open("configs/model.yaml"))
@@ -29,12 +29,14 @@ def dims_text():
     ds = list(RUB["dimensions"].keys())
     return ", ".join(ds), "{" + ", ".join([f'"{d}":X' for d in ds]) + "}"
 
-def judge_one(data, out_text):
+def judge_prompts(data, out_text):
     dims, keys = dims_text()
+    return [PROMPTS[i % len(PROMPTS)].format(dims=dims, keys=keys, data=json.dumps(data), out=out_text)
+            for i in range(CFG["judge"]["n_prompts"])]
+
+def aggregate(js_texts):
     results = []
-    for i in range(CFG["judge"]["n_prompts"]):
-        prompt = PROMPTS[i % len(PROMPTS)].format(dims=dims, keys=keys, data=json.dumps(data), out=out_text)
-        js_text = call_chat(CFG["judge"], "Return strict JSON only.", prompt)
+    for js_text in js_texts:
         start, end = js_text.find("{"), js_text.rfind("}")
         try:
             js = json.loads(js_text[start:end+1]) if start!=-1 and end!=-1 else {"scores":{}}
@@ -47,10 +49,15 @@ def judge_one(data, out_text):
     return {"dim_scores": agg, "final": weighted}
 
 def run(infer_path, out_path):
+    exs = [json.loads(line) for line in open(infer_path)]
+    n = CFG["judge"]["n_prompts"]
+    # all (row, variant) prompts go out as one batch; with schedule: prefix the
+    # variants are grouped so each shared instruction block is reused across rows
+    prompts = [p for ex in exs for p in judge_prompts(ex["input"], ex["raw"])]
+    js_texts = call_many(CFG["judge"], "Return strict JSON only.", prompts, CFG["judge"].get("schedule", "file"))
     outs = []
-    for line in open(infer_path):
-        ex = json.loads(line)
-        j = judge_one(ex["input"], ex["raw"])
+    for k, ex in enumerate(exs):
+        j = aggregate(js_texts[k*n:(k+1)*n])
         outs.append({"id": ex["id"], "tag": ex["tag"], "blocked": ex["blocked"], **j})
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     with open(out_path,"w") as f:
@@ -8,7 +8,8 @@ import ray
 from dotenv import load_dotenv, find_dotenv
 from guardrails import Guard
 from apps.wellness_coach.schemas import WellnessOutput
-from apps.providers import call_chat
+from apps.providers import call_chat, resident
+from apps.scheduling import prefix_order
 
 def parse_args():
     ap = argparse.ArgumentParser(description="Ray-parallel MUT inference")
@@ -58,25 +59,41 @@ def main():
     if args.limit and args.limit > 0:
         ds = ds.limit(args.limit)
 
-    # Spin up actors
-    workers = [Worker.remote(CFG["mut"], args.prompt, args.throttle_sec) for _ in range(args.num_actors)]
+    # Pin the model for the whole run: actors get the pinned block (keep_alive=-1)
+    # so their requests don't reset residency, and the lazy pipeline executes
+    # inside write_json, before the pin is released.
+    with resident(CFG["mut"]) as block:
+        # Spin up actors
+        workers = [Worker.remote(block, args.prompt, args.throttle_sec) for _ in range(args.num_actors)]
 
-    # Map in batches for efficiency
-    def map_batch(df: pd.DataFrame) -> pd.DataFrame:
-        recs = df.to_dict("records")
-        futs = [workers[i % len(workers)].infer_one.remote(r) for i, r in enumerate(recs)]
-        outs = ray.get(futs)
-        return pd.DataFrame(outs)
+        # Map in batches for efficiency. With schedule: prefix each batch is sorted by
+        # rendered prompt and split into contiguous slices, so every actor sends
+        # neighbouring prefixes back to back instead of a round-robin interleave.
+        schedule = CFG["mut"].get("schedule", "file")
+        prompt_name = args.prompt
+        def map_batch(df: pd.DataFrame) -> pd.DataFrame:
+            recs = df.to_dict("records")
+            order = list(range(len(recs)))
+            if schedule == "prefix":
+                T = jinja2.Environment(
+                    loader=jinja2.FileSystemLoader("apps/wellness_coach/prompt_templates")
+                ).get_template(prompt_name)
+                order = prefix_order([T.render(**r) for r in recs])
+            per = -(-len(recs) // len(workers))
+            futs = [workers[k // per].infer_one.remote(recs[i]) for k, i in enumerate(order)]
+            outs = [None] * len(recs)
+            for i, o in zip(order, ray.get(futs)): outs[i] = o
+            return pd.DataFrame(outs)
 
-    os.makedirs(args.outdir, exist_ok=True)
-    ds = ds.map_batches(
-        map_batch,
-        batch_size=args.batch_size,
-        batch_format="pandas",
-        concurrency=args.num_actors,
-        zero_copy_batch=False,
-    )
-    ds.write_json(args.outdir)  # writes multiple shard files
+        os.makedirs(args.outdir, exist_ok=True)
+        ds = ds.map_batches(
+            map_batch,
+            batch_size=args.batch_size,
+            batch_format="pandas",
+            concurrency=args.num_actors,
+            zero_copy_batch=False,
+        )
+        ds.write_json(args.outdir)  # writes multiple shard files
     print("Ray inference shards →", args.outdir)
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+# path shim
+import os, sys, json, argparse
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path: sys.path.insert(0, ROOT)
+
+import numpy as np, pandas as pd
+import pyarrow.json as pa_json
+from pathlib import Path
+
+# +1 = higher is better, -1 = lower is better, 0 = informational (never gates)
+DIRECTION = {
+    "final": 1,
+    "blocked": -1, "len_chars": 0, "has_disclaimer": 1, "safety_hits": -1,
+    "rougeL_f": 1, "bertscore_f1": 1, "embed_cosine": 1, "ppl_gpt2": -1,
+}
+# Smallest regression that can fail --fail-on-regression, in each metric's own
+# units. Looked up by metric name, then by stage (any judge dimension is on the
+# 1-5 scale); "human" is the human win rate's distance below 0.5.
+MIN_EFFECT = {
+    "judge": 0.1,
+    "blocked": 0.01, "has_disclaimer": 0.01, "safety_hits": 0.01,
+    "rougeL_f": 0.01, "bertscore_f1": 0.01, "embed_cosine": 0.01, "ppl_gpt2": 1.0,
+    "human": 0.02,
+}
+HUMAN_DIMS = ["helpful", "factual", "safety", "clarity"]
+
+# Above MAX_BINS distinct values a metric is treated as continuous and
+# collapsed to MAX_BINS equal-count quantile bins before resampling.
+MAX_BINS = 1024
+
+def support(x):
+    """Distinct values of `x`, their counts, and within-value variance.
+
+    Discrete metrics (<= MAX_BINS distinct values) are returned exactly with
+    variance None. Continuous ones are cut into MAX_BINS equal-count quantile
+    bins, returned as bin means plus each bin's variance so the resampler can
+    put the within-bin spread back (it dominates in heavy tails like ppl_gpt2).
+    """
+    vals, counts = np.unique(x, return_counts=True)
+    if vals.size <= MAX_BINS:
+        return vals, counts, None
+    edges = np.linspace(0, x.size, MAX_BINS + 1).astype(int)
+    counts = np.diff(edges)
+    xs = np.sort(x)
+    means = np.add.reduceat(xs, edges[:-1]) / counts
+    var = np.add.reduceat((xs - np.repeat(means, counts)) ** 2, edges[:-1]) / counts
+    return means, counts, var
+
+def bootstrap_means(x, n_boot, rng):
+    """Return `n_boot` bootstrap means of the 1-D array `x`.
+
+    Resampling n items with replacement is a multinomial draw over the distinct
+    values, so all resamples are drawn as one (n_boot, k) count matrix and
+    reduced with a single matmul: O(n_boot * k) regardless of n. This is exact
+    for judge scores, win indicators and 0/1 flags. For binned continuous
+    metrics, a resample taking c_j items from bin j gets their spread around
+    the bin mean as a normal term with variance sum_j c_j * var_j, which keeps
+    the bootstrap SE matched to the full resample.
+    """
+    vals, counts, var = support(x)
+    draws = rng.multinomial(x.size, counts / x.size, size=n_boot)
+    totals = draws @ vals
+    if var is not None:
+        totals += np.sqrt(draws @ var) * rng.standard_normal(n_boot)
+    return totals / x.size
+
+def summarize(x, n_boot, rng, alpha=0.05, null=0.0):
+    """Mean and bootstrap CI of `x`; adds a two-sided p-value against `null` unless it is None."""
+    x = np.asarray(x, dtype=float)
+    x = x[~np.isnan(x)]
+    if not x.size:
+        return None
+    boot = bootstrap_means(x, n_boot, rng)
+    lo, hi = np.quantile(boot, [alpha / 2, 1 - alpha / 2])
+    out = {"n": int(x.size), "mean": float(x.mean()), "ci_lo": float(lo), "ci_hi": float(hi)}
+    if null is not None:
+        out["p"] = float(min(1.0, 2 * min((boot <= null).mean(), (boot >= null).mean())))
+    return out
+
+def holm(pvals):
+    """Holm step-down adjusted p-values (family-wise error control), same order as input."""
+    p = np.asarray(pvals, dtype=float)
+    order = np.argsort(p)
+    adj = np.maximum.accumulate((p.size - np.arange(p.size)) * p[order])
+    out = np.empty(p.size)
+    out[order] = np.minimum(adj, 1.0)
+    return out
+
+def min_effect(name, overrides):
+    """Gate threshold for `name` ("judge.final", "ref.ppl_gpt2", "human"): CLI override, else MIN_EFFECT."""
+    if name in overrides:
+        return overrides[name]
+    stage, _, metric = name.rpartition(".")
+    return MIN_EFFECT.get(metric, MIN_EFFECT.get(stage, 0.0))
+
+def min_effect_arg(spec):
+    """argparse type for `--min-effect METRIC=VALUE` -> (metric, value)."""
+    name, sep, val = spec.partition("=")
+    try:
+        if sep and name: return name, float(val)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"expected METRIC=VALUE, got {spec!r}")
+
+def win_score(delta):
+    # 1 = mut wins, 0.5 = tie, 0 = baseline wins; NaN stays NaN
+    return np.where(np.isnan(delta), np.nan, (delta > 0) + 0.5 * (delta == 0))
+
+# --- stage loaders: each returns one row per id with numeric metric columns ---
+
+def load_judged(path):
+    # arrow's JSON reader is ~10x faster than pandas and flattens dim_scores.* for us
+    t = pa_json.read_json(path).flatten()
+    cols = ["id", "final"] + [c for c in t.column_names if c.startswith("dim_scores.")]
+    df = t.select(cols).to_pandas()
+    return df.rename(columns=lambda c: c.split(".", 1)[-1]).astype({"id": str})
+
+def load_auto(path):
+    df = pd.read_csv(path, dtype={"id": str})
+    return df.drop(columns=["tag"], errors="ignore")
+
+def load_ref(path):
+    return pd.read_csv(path, dtype={"id": str})
+
+def paired_deltas(loader, mut_path, base_path):
+    """Inner-join mut/baseline on id and return per-id (mut - baseline) columns."""
+    if not (os.path.exists(mut_path) and os.path.exists(base_path)):
+        print(f"[skip] missing {mut_path} or {base_path}")
+        return None
+    m = loader(mut_path).drop_duplicates("id")
+    b = loader(base_path).drop_duplicates("id")
+    j = m.merge(b, on="id", suffixes=("@mut", "@base"))
+    cols = [c for c in m.columns if c != "id" and c in b.columns]
+    skipped = sorted(set(m.columns) ^ set(b.columns))
+    if skipped:
+        print(f"[skip] columns not in both {mut_path} and {base_path}: {', '.join(skipped)}")
+    d = {c: j[f"{c}@mut"].astype(float).to_numpy() - j[f"{c}@base"].astype(float).to_numpy() for c in cols}
+    return pd.DataFrame(d, index=j["id"])
+
+def human_wins(annotations, pairs, mut_tag):
+    """Per-item mut win rate from blind prefs, decoded through pairs.jsonl answer_key."""
+    if not (os.path.exists(annotations) and os.path.exists(pairs)):
+        print(f"[skip] missing {annotations} or {pairs}")
+        return None, None
+    ann = pd.read_csv(annotations, dtype={"id": str})
+    key = pd.read_json(pairs, lines=True, dtype={"id": str})
+    key = pd.DataFrame({"id": key["id"],
+                        "A_is": key["answer_key"].str.get("A_is"),
+                        "B_is": key["answer_key"].str.get("B_is")}).drop_duplicates("id")
+    ann = ann.merge(key, on="id")
+    pref = ann["pref"].to_numpy()
+    winner = np.where(pref == "A", ann["A_is"].to_numpy(), ann["B_is"].to_numpy())
+    ann["win"] = np.where(pref == "Tie", 0.5, (winner == mut_tag).astype(float))
+    # average per item first so items with more raters don't dominate the resample
+    per_item = ann.groupby("id")[["win"] + HUMAN_DIMS].mean()
+    return per_item["win"], per_item[HUMAN_DIMS]
+
+def main(a):
+    rng = np.random.default_rng(a.seed)
+    stages = {
+        "judge": paired_deltas(load_judged, f"{a.judged}/{a.mut_tag}.jl", f"{a.judged}/{a.base_tag}.jl"),
+        "auto": paired_deltas(load_auto, f"{a.metrics}/{a.mut_tag}.csv", f"{a.metrics}/{a.base_tag}.csv"),
+        "ref": paired_deltas(load_ref, f"{a.metrics_ref}/{a.mut_tag}.csv", f"{a.metrics_ref}/{a.base_tag}.csv"),
+    }
+    stages = {k: v.add_prefix(f"{k}.") for k, v in stages.items() if v is not None}
+    # one wide frame: rows = ids seen in any stage, cols = "<stage>.<metric>" deltas
+    deltas = pd.concat(stages.values(), axis=1, join="outer") if stages else pd.DataFrame()
+
+    report = {"mut": a.mut_tag, "baseline": a.base_tag, "n_boot": a.n_boot,
+              "alpha": a.alpha, "deltas": {}, "win_rates": {}, "human_likert": {}}
+    for col in deltas.columns:
+        report["deltas"][col] = summarize(deltas[col].to_numpy(), a.n_boot, rng, a.alpha)
+    if "judge.final" in deltas:
+        report["win_rates"]["judge"] = summarize(win_score(deltas["judge.final"].to_numpy()),
+                                                 a.n_boot, rng, a.alpha, null=0.5)
+    wins, likert = human_wins(a.annotations, a.pairs, a.mut_tag)
+    if wins is not None:
+        report["win_rates"]["human"] = summarize(wins.to_numpy(), a.n_boot, rng, a.alpha, null=0.5)
+        for dim in HUMAN_DIMS:
+            # Likert scores aren't attributed to a system: descriptive only, no test
+            report["human_likert"][dim] = summarize(likert[dim].to_numpy(), a.n_boot, rng, a.alpha, null=None)
+
+    # Gate family: every directional delta plus the human win rate. The judge win
+    # rate is derived from judge.final, so it is reported but not gated twice.
+    # A regression needs a Holm-adjusted p < alpha, the wrong sign, and
+    # |effect| >= the metric's MIN_EFFECT (win rates: distance from 0.5).
+    overrides = dict(a.min_effect)
+    gated = [(f"deltas/{c}", s, DIRECTION.get(c.split(".", 1)[1], 1) * s["mean"])
+             for c, s in report["deltas"].items() if s and DIRECTION.get(c.split(".", 1)[1], 1)]
+    s = report["win_rates"].get("human")
+    if s: gated.append(("win_rates/human", s, s["mean"] - 0.5))
+    regressions = []
+    for (name, s, effect), p_adj in zip(gated, holm([g[1]["p"] for g in gated])):
+        s["p_holm"] = float(p_adj)
+        s["min_effect"] = min_effect(name.split("/", 1)[1], overrides)
+        if p_adj < a.alpha and effect < 0 and -effect >= s["min_effect"]:
+            regressions.append(name)
+    report["regressions"] = regressions
+
+    Path(os.path.dirname(a.out)).mkdir(parents=True, exist_ok=True)
+    with open(a.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if a.deltas_out:
+        deltas.to_csv(a.deltas_out, index_label="id")
+
+    pct = int(round((1 - a.alpha) * 100))
+    print(f"{a.mut_tag} - {a.base_tag}  ({a.n_boot} paired bootstrap resamples, {pct}% CI)")
+    for section in ("deltas", "win_rates", "human_likert"):
+        for name, s in report[section].items():
+            if s is None: continue
+            line = f"  {section}/{name}: mean={s['mean']:+.4f} [{s['ci_lo']:+.4f}, {s['ci_hi']:+.4f}]"
+            if "p" in s: line += f" p={s['p']:.4f}"
+            if "p_holm" in s: line += f" p_holm={s['p_holm']:.4f}"
+            print(f"{line} N={s['n']}")
+    print("Wrote", a.out)
+    if regressions:
+        print("Significant regressions:", ", ".join(regressions))
+        if a.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Paired bootstrap CIs and win rates: mut vs baseline")
+    ap.add_argument("--mut-tag", default="mut_v1")
+    ap.add_argument("--base-tag", default="baseline_v2")
+    ap.add_argument("--judged", default="out/judged")
+    ap.add_argument("--metrics", default="out/metrics")
+    ap.add_argument("--metrics-ref", default="out/metrics_ref")
+    ap.add_argument("--pairs", default="out/human/pairs.jsonl")
+    ap.add_argument("--annotations", default="out/human/annotations.csv")
+    ap.add_argument("--n-boot", type=int, default=10000)
+    ap.add_argument("--alpha", type=float, default=0.05)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="out/analysis/significance.json")
+    ap.add_argument("--deltas-out", default="", help="Optional CSV of joined per-id deltas")
+    ap.add_argument("--fail-on-regression", action="store_true",
+                    help="Exit 1 if mut is significantly worse (Holm-adjusted) on any gated metric (for CI)")
+    ap.add_argument("--min-effect", action="append", default=[], type=min_effect_arg, metavar="METRIC=VALUE",
+                    help="Override one metric's MIN_EFFECT gate threshold, in that metric's units "
+                         "(e.g. judge.final=0.2, ref.ppl_gpt2=2, human=0.05); repeatable")
+    main(ap.parse_args())
@@ -8,7 +8,7 @@ from pathlib import Path
 import yaml, jinja2
 from guardrails import Guard
 from apps.wellness_coach.schemas import WellnessOutput
-from apps.providers import call_chat
+from apps.scheduling import call_many
 
 def flatten(parsed):
     if not parsed: return ""
@@ -29,12 +29,14 @@ def main(infile="evals/datasets/test.jsonl", outpath="evals/datasets/refs.jsonl"
 
     guard = Guard.from_pydantic(WellnessOutput)
     Path(os.path.dirname(outpath)).mkdir(parents=True, exist_ok=True)
+    exs = []
+    for i, line in enumerate(open(infile)):
+        if limit and i >= limit: break
+        exs.append(json.loads(line))
+    raws = call_many(CFG["judge"], "You are an expert wellness coach.",
+                     [T.render(**ex) for ex in exs], CFG["judge"].get("schedule", "file"))
     with open(outpath, "w") as out:
-        for i, line in enumerate(open(infile)):
-            if limit and i >= limit: break
-            ex = json.loads(line)
-            prompt = T.render(**ex)
-            raw = call_chat(CFG["judge"], "You are an expert wellness coach.", prompt)
+        for ex, raw in zip(exs, raws):
             try:
                 parsed = guard.parse(llm_output=raw, num_reasks=1).validated_output
             except Exception: